@@ -1,18 +1,32 @@
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import click
 from flask import Flask
 from flask_cors import CORS
 from api_routes.newsroutes import news_bp
 from api_routes.searchroutes import search_bp
 from config import Config
-from extensions import mongo, jwt
+from extensions import mongo, jwt, ORJSONProvider, ensure_indexes
+from services.session_service import purge_orphaned_messages, backfill_last_activity
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# Initialize MongoDB
-mongo.init_app(app)
+# Initialize MongoDB with a small, warm connection pool and fail-fast timeouts
+mongo.init_app(
+    app,
+    maxPoolSize=app.config['MONGO_MAX_POOL_SIZE'],
+    minPoolSize=app.config['MONGO_MIN_POOL_SIZE'],
+    maxIdleTimeMS=60_000,
+    waitQueueTimeoutMS=2000,
+    serverSelectionTimeoutMS=3000,
+)
+ensure_indexes(app.config['SESSION_RETENTION_DAYS'])
+
+# Use orjson for all jsonify/get_json calls. Must come after mongo.init_app, which installs
+# Flask-PyMongo's BSONProvider and would otherwise replace this one
+app.json = ORJSONProvider(app)
 
 # Initialize JWT
 jwt.init_app(app)
@@ -24,5 +38,16 @@ app.register_blueprint(auth.auth_bp, url_prefix='/api/auth')
 app.register_blueprint(news_bp, url_prefix='/api/news')
 app.register_blueprint(search_bp, url_prefix='/api/search')
 
+# Maintenance commands, e.g. `flask --app api/index.py purge-orphaned-messages`
+@app.cli.command("purge-orphaned-messages")
+def purge_orphaned_messages_command():
+    """Delete messages of sessions the TTL index has expired. Schedule on a single runner."""
+    click.echo(f"Deleted {purge_orphaned_messages()} orphaned messages")
+
+@app.cli.command("backfill-session-activity")
+def backfill_session_activity_command():
+    """One-off migration: set last_activity_at on sessions created before it existed."""
+    click.echo(f"Updated {backfill_last_activity()} sessions")
+
 if __name__ == '__main__':
     app.run(debug=True,port=5001)
@@ -36,14 +36,14 @@ def require_session(f):
             
             return f(*args, **kwargs)
         except Exception as e:
-            current_app.logger.error(f"Session verification failed: {str(e)}")
+            current_app.logger.error("Session verification failed: %s", e)
             return jsonify({'message': 'Invalid session token'}), 401
     return decorated_function
 
 def require_api_key(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        API_KEY=os.getenv('API_KEY')
+        API_KEY = current_app.config.get('API_KEY')
         api_key = request.headers.get('API-AUTH-KEY')
         if api_key and api_key == API_KEY:
             return f(*args, **kwargs)
@@ -74,14 +74,14 @@ def save_session_response(response_data):
         'response': response_data.get('response'),
         'sources': response_data.get('sources', []),
         'success': response_data.get('success', False),
-        'timestamp': datetime.datetime.utcnow()
+        'timestamp': datetime.datetime.now(datetime.timezone.utc)
     }
     
     try:
         # Insert the document into a sessions collection
         result = mongo.db.sessions.insert_one(session_document)
-        current_app.logger.info(f"Saved session response with ID: {result.inserted_id}")
+        current_app.logger.info("Saved session response with ID: %s", result.inserted_id)
         return True
     except Exception as e:
-        current_app.logger.error(f"Error saving session response: {str(e)}")
+        current_app.logger.error("Error saving session response: %s", e)
         return False
\ No newline at end of file
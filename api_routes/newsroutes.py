@@ -2,16 +2,22 @@ from flask import Blueprint, request, jsonify, current_app
 from .auth import require_api_key, require_session  # need this for server to server authentication
 import logging
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from bson import ObjectId
 from dotenv import load_dotenv
 from services.session_service import (
-    create_session, add_message, get_messages, list_sessions, 
-    clear_messages, delete_session, update_session_title, get_session
+    create_session, add_messages, get_messages, list_sessions, 
+    clear_messages, delete_session, update_session_title, get_session,
+    DEFAULT_SESSION_PAGE_SIZE, MAX_SESSION_PAGE_SIZE, DEFAULT_HISTORY_LIMIT, MAX_HISTORY_LIMIT
 )
 from services.session_title_service import get_title_generator
 from extensions import mongo  # Add this import to fix the undefined variable error
 
 load_dotenv()
-from services.newsagentservice import NewsAgentService
+from services.newsagentservice import NewsAgentService, HISTORY_WINDOW_TURNS
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +25,16 @@ news_bp = Blueprint('news', __name__)
 
 news_agent = None # Initialize news agent service
 title_generator = None # Initialize title generator service
+_news_agent_lock = threading.Lock() # Guards one-time initialization across worker threads
+_title_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="session-title") # Off-request title generation
+
+_HEX_RE = re.compile(r"[0-9a-fA-F]{24}")
+
+def _to_oid(value):
+    """Convert a 24-char hex string to an ObjectId, or return None if it is malformed."""
+    if len(value) == 24 and _HEX_RE.fullmatch(value):
+        return ObjectId(value)
+    return None
 
 def get_news_agent():
     """
@@ -29,7 +45,14 @@ def get_news_agent():
     """
     global news_agent, title_generator
     
-    if news_agent is None:
+    if news_agent is not None:
+        return news_agent
+    
+    with _news_agent_lock:
+        # Another thread may have finished initialization while we waited
+        if news_agent is not None:
+            return news_agent
+        
         GOOGLE_API_KEY = current_app.config.get('GOOGLE_API_KEY') or os.getenv('GOOGLE_API_KEY')
         serper_api_key = current_app.config.get('SERPER_API_KEY') or os.getenv('SERPER_API_KEY')
         
@@ -37,14 +60,17 @@ def get_news_agent():
             logger.error("Missing API keys")
             return None
        
-        news_agent = NewsAgentService(
+        agent = NewsAgentService(
             GOOGLE_API_KEY=GOOGLE_API_KEY,
             serper_api_key=serper_api_key
         )
         
         # Initialize title generator if not already done
         if title_generator is None:
-            title_generator = get_title_generator(news_agent)
+            title_generator = get_title_generator(agent)
+        
+        # Publish the agent last so other threads never see a half-initialized service
+        news_agent = agent
     
     return news_agent
 
@@ -73,9 +99,26 @@ def get_title_for_query(query):
     try:
         return title_generator.generate_title(query)
     except Exception as e:
-        logger.error(f"Error generating title: {str(e)}")
+        logger.error("Error generating title: %s", e)
         return "News Conversation"
 
+def _generate_and_store_title(session_id, user_id, query):
+    """
+    Generate a title for a session's first query and save it.
+    Runs on _title_executor, so it must not touch the request or app context.
+    
+    Returns:
+        str: The title that was stored
+    """
+    if title_generator is None:
+        logger.error("Could not initialize title generator")
+        return "New Conversation"
+    
+    title = title_generator.generate_title(query)
+    update_session_title(session_id, title, user_id)
+    logger.info("Generated title for new session: '%s'", title)
+    return title
+
 @news_bp.route('/ask', methods=['POST'])
 # @require_api_key #decorator
 @require_session
@@ -110,7 +153,7 @@ def ask_news_agent():
         return jsonify(result)
         
     except Exception as e:
-        logger.error(f"Error processing news query: {str(e)}")
+        logger.error("Error processing news query: %s", e)
         return jsonify({
             'success': False,
             'error': 'An error occurred while processing your request',
@@ -151,7 +194,7 @@ def ask_news_agent_tracker():
         return jsonify(result)
         
     except Exception as e:
-        logger.error(f"Error processing news query: {str(e)}")
+        logger.error("Error processing news query: %s", e)
         return jsonify({
             'success': False,
             'error': 'An error occurred while processing your request',
@@ -184,7 +227,7 @@ def clear_conversation():
         })
         
     except Exception as e:
-        logger.error(f"Error clearing conversation: {str(e)}")
+        logger.error("Error clearing conversation: %s", e)
         return jsonify({
             'success': False,
             'error': 'An error occurred while clearing the conversation',
@@ -209,13 +252,16 @@ def get_conversation_history():
     
     try:
         history = agent.memory.chat_memory.messages
-        return jsonify({
+        response = jsonify({
             'success': True,
             'history': [{'role': msg.type, 'content': msg.content} for msg in history]
         })
+        # Let polling clients revalidate with If-None-Match and get an empty 304
+        response.add_etag()
+        return response.make_conditional(request)
         
     except Exception as e:
-        logger.error(f"Error getting conversation history: {str(e)}")
+        logger.error("Error getting conversation history: %s", e)
         return jsonify({
             'success': False,
             'error': 'An error occurred while getting conversation history',
@@ -231,14 +277,13 @@ def start_session():
     if 'user_id' not in data:
         return jsonify({'success': False, 'error': 'Missing user_id'}), 400
     
-    # Create session with default title (will be updated when first message is sent)
-    session_id = create_session(data['user_id'])
-    
     # If initial query is provided, use it to generate a title
     initial_title = "New Conversation"
     if 'initial_query' in data:
         initial_title = get_title_for_query(data['initial_query'])
-        update_session_title(session_id, initial_title)
+    
+    # Create session with its title in a single insert (default title will be updated when first message is sent)
+    session_id = create_session(data['user_id'], initial_title)
         
     return jsonify({
         'success': True, 
@@ -265,7 +310,7 @@ def ask_session(session_id):
         return jsonify({'success': False, 'error': 'Init error'}), 500
     
     # First check if the session exists and belongs to the user
-    session = mongo.db.chat_sessions.find_one({"session_id": session_id})
+    session = mongo.db.chat_sessions.find_one({"session_id": session_id}, {"_id": 0, "user_id": 1})
     if session:
         # Session exists, check if it belongs to this user
         if session.get("user_id") != user_id:
@@ -274,61 +319,90 @@ def ask_session(session_id):
         # Session doesn't exist at all
         return jsonify({'success': False, 'error': 'Session not found'}), 404
     
-    # Get message history (might be empty for new sessions)
-    history = get_messages(session_id, user_id)
-    logger.info(f"Loading {len(history)} messages from session {session_id}")
+    # Get message history (might be empty for new sessions); the agent only uses the last few turns
+    history = get_messages(session_id, user_id, tail=2 * HISTORY_WINDOW_TURNS)
+    logger.info("Loading %s messages from session %s", len(history), session_id)
     
-    # If this is the first message in the session, generate a title
+    # If this is the first message in the session, generate and save a title in the
+    # background while the agent works on the response
     is_first_message = len(history) == 0
-    if is_first_message:
-        title = get_title_for_query(user_query)
-        update_session_title(session_id, title)
-        logger.info(f"Generated title for new session: '{title}'")
+    title_future = _title_executor.submit(_generate_and_store_title, session_id, user_id, user_query) if is_first_message else None
     
     # Clear current agent memory and load history
-    agent.memory.clear()
+    agent.clear_conversation()
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
     for msg in history:
         if msg['role'] == 'user':
-            agent.memory.chat_memory.add_user_message(msg['content'])
-            logger.debug(f"Added user message to memory: {msg['content'][:50]}...")
+            agent.add_user_message(msg['content'])
+            if debug_enabled:
+                logger.debug("Added user message to memory: %s...", msg['content'][:50])
         elif msg['role'] == 'ai':
-            agent.memory.chat_memory.add_ai_message(msg['content'])
-            logger.debug(f"Added AI message to memory: {msg['content'][:50]}...")
+            agent.add_ai_message(msg['content'])
+            if debug_enabled:
+                logger.debug("Added AI message to memory: %s...", msg['content'][:50])
     
     # Log memory state for debugging        
     memory_messages = agent.memory.chat_memory.messages
-    logger.info(f"Agent memory now has {len(memory_messages)} messages")
-    
-    # Store user message and generate response
-    add_message(session_id, 'user', user_query)
+    logger.info("Agent memory now has %s messages", len(memory_messages))
     
     # Generate response with history context
     result = agent.generate_response(user_query)
     ai_resp = result.get('response')
     sources = result.get('sources')
     
-    # Store AI response with sources as metadata
-    add_message(session_id, 'ai', ai_resp, {"sources": sources} if sources else None)
+    # Store the user message and the AI response (with sources as metadata) in one round-trip
+    ai_message = {'role': 'ai', 'content': ai_resp}
+    if sources:
+        ai_message['sources'] = sources
+    add_messages(session_id, [{'role': 'user', 'content': user_query}, ai_message])
     
     # Add session info to the result
     result['session_id'] = session_id
     
-    # Get the current session title if this was the first message
-    if is_first_message:
-        result['title'] = title
+    # Get the current session title if this was the first message (normally finished long before the agent)
+    if title_future is not None:
+        try:
+            result['title'] = title_future.result()
+        except Exception as e:
+            logger.error("Error generating title: %s", e)
     
     return jsonify(result)
 
 @news_bp.route('/sessions', methods=['GET'])
 @require_api_key
 def get_sessions_route():
-    """List all chat sessions for a user"""
+    """List a page of chat sessions for a user, newest first"""
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'success': False, 'error': 'Missing user_id parameter'}), 400
+    
+    try:
+        limit = int(request.args.get('limit', DEFAULT_SESSION_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit parameter'}), 400
+    limit = max(1, min(limit, MAX_SESSION_PAGE_SIZE))
+    
+    before = request.args.get('before')
+    if before:
+        try:
+            before = datetime.fromisoformat(before.replace('Z', '+00:00'))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid before parameter'}), 400
+        if before.tzinfo is None:
+            before = before.replace(tzinfo=timezone.utc)
+    else:
+        before = None
+    before_id = request.args.get('before_id') or None
         
-    sessions = list_sessions(user_id)
-    return jsonify({'success': True, 'sessions': sessions})
+    sessions = list_sessions(user_id, before=before, before_id=before_id, limit=limit)
+    # Cursor for the next page; None once the last page has been returned
+    last = sessions[-1] if len(sessions) == limit else None
+    return jsonify({
+        'success': True,
+        'sessions': sessions,
+        'next_before': last['created_at'] if last else None,
+        'next_before_id': last['session_id'] if last else None
+    })
 
 @news_bp.route('/session/<session_id>', methods=['GET'])
 @require_api_key
@@ -370,17 +444,25 @@ def update_session_title_route(session_id):
 @news_bp.route('/session/<session_id>/history', methods=['GET'])
 @require_api_key
 def session_history(session_id):
-    """Get history for a session"""
+    """Get the most recent history for a session"""
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'success': False, 'error': 'Missing user_id parameter'}), 400
+    
+    try:
+        limit = int(request.args.get('limit', DEFAULT_HISTORY_LIMIT))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit parameter'}), 400
+    limit = max(1, min(limit, MAX_HISTORY_LIMIT))
         
-    messages = get_messages(session_id, user_id)
-    if not messages and mongo.db.chat_sessions.find_one({"session_id": session_id}):
+    messages = get_messages(session_id, user_id, tail=limit)
+    if not messages and mongo.db.chat_sessions.find_one({"session_id": session_id}, {"_id": 1}):
         # Session exists but doesn't belong to this user
         return jsonify({'success': False, 'error': 'Session not found or unauthorized'}), 403
         
-    return jsonify({'success': True, 'history': messages})
+    response = jsonify({'success': True, 'history': messages})
+    response.add_etag()
+    return response.make_conditional(request)
 
 @news_bp.route('/session/<session_id>/clear', methods=['POST'])
 @require_api_key
@@ -433,7 +515,7 @@ def get_tracked_queries():
     
     try:
         # Log the query attempt for debugging
-        logger.info(f"Attempting to retrieve tracked queries for user_id: {user_id}")
+        logger.info("Attempting to retrieve tracked queries for user_id: %s", user_id)
         
         # Get the news_tracker database from the same MongoDB cluster
         db_name = "news_tracker"  # Specify the correct database name
@@ -446,10 +528,10 @@ def get_tracked_queries():
         
         # Check if collection exists
         if collection_name not in news_tracker_db.list_collection_names():
-            logger.warning(f"{collection_name} collection does not exist in the {db_name} database")
+            logger.warning("%s collection does not exist in the %s database", collection_name, db_name)
             # Create the collection if it doesn't exist
             news_tracker_db.create_collection(collection_name)
-            logger.info(f"Created {collection_name} collection in {db_name} database")
+            logger.info("Created %s collection in %s database", collection_name, db_name)
             return jsonify({
                 'success': True,
                 'tracked_queries': [],
@@ -458,7 +540,7 @@ def get_tracked_queries():
         
         # Count documents in collection for this user (for debugging)
         count = tracked_queries_collection.count_documents({"user_id": user_id})
-        logger.info(f"Found {count} tracked queries for user_id: {user_id} in {db_name}.{collection_name}")
+        logger.info("Found %s tracked queries for user_id: %s in %s.%s", count, user_id, db_name, collection_name)
         
         # Find all tracked queries for this user
         tracked_queries = list(tracked_queries_collection.find(
@@ -479,7 +561,7 @@ def get_tracked_queries():
         })
         
     except Exception as e:
-        logger.error(f"Error retrieving tracked queries: {str(e)}")
+        logger.error("Error retrieving tracked queries: %s", e)
         return jsonify({
             'success': False,
             'error': 'An error occurred while retrieving tracked queries',
@@ -512,7 +594,6 @@ def get_tracked_query_details(query_id):
         }), 400
     
     try:
-        from bson import ObjectId
         import copy
         
         # Get the news_tracker database from the same MongoDB cluster
@@ -525,19 +606,18 @@ def get_tracked_query_details(query_id):
         tracked_queries_collection = news_tracker_db[collection_name]
         
         # Check if the query_id is a valid ObjectId
-        try:
-            query_obj_id = ObjectId(query_id)
-        except Exception:
+        query_obj_id = _to_oid(query_id)
+        if query_obj_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid query ID format'
             }), 400
         
-        # Find the tracked query document
-        tracked_query = tracked_queries_collection.find_one({
-            "_id": query_obj_id,
-            "user_id": user_id
-        })
+        # Find the tracked query document (summary_lines is internal to the diffing, so leave it out)
+        tracked_query = tracked_queries_collection.find_one(
+            {"_id": query_obj_id, "user_id": user_id},
+            {"tracking_history.summary_lines": 0}
+        )
         
         if not tracked_query:
             return jsonify({
@@ -554,7 +634,7 @@ def get_tracked_query_details(query_id):
         # Restructure the tracking_history if it exists
         if include_history and 'tracking_history' in result_query and result_query['tracking_history']:
             try:
-                logger.info(f"Transforming tracking history for query {query_id}, found {len(result_query['tracking_history'])} history items")
+                logger.info("Transforming tracking history for query %s, found %s history items", query_id, len(result_query['tracking_history']))
                 
                 # Sort history by date (newest first)
                 tracking_history = sorted(
@@ -566,7 +646,7 @@ def get_tracked_query_details(query_id):
                 # Extract the latest update 
                 if tracking_history:
                     latest_update = tracking_history[0]
-                    logger.info(f"Latest update date: {latest_update.get('date')}")
+                    logger.info("Latest update date: %s", latest_update.get('date'))
                     
                     # Add latest update fields directly to the result object
                     result_query['summary'] = latest_update.get('summary')
@@ -581,7 +661,7 @@ def get_tracked_query_details(query_id):
                             if 'title' in source:
                                 sources_obj[source['title']] = source
                         result_query['sources'] = sources_obj
-                        logger.info(f"Transformed array of {len(sources)} sources into object with title keys")
+                        logger.info("Transformed array of %s sources into object with title keys", len(sources))
                     else:
                         # Already an object with keys
                         result_query['sources'] = sources
@@ -594,14 +674,14 @@ def get_tracked_query_details(query_id):
                     # Start from index 1 to skip the latest update
                     for history_item in tracking_history[1:]:
                         history_date = history_item.get('date')
-                        logger.info(f"Processing history item from date: {history_date}")
+                        logger.info("Processing history item from date: %s", history_date)
                         
                         hist_sources = history_item.get('sources', {})
                         
                         # Handle different source formats
                         if isinstance(hist_sources, list):
                             source_count = len(hist_sources)
-                            logger.info(f"Found {source_count} sources in array format")
+                            logger.info("Found %s sources in array format", source_count)
                             
                             for source in hist_sources:
                                 if 'title' in source:
@@ -609,10 +689,10 @@ def get_tracked_query_details(query_id):
                                     source_data = dict(source)  # Create a copy
                                     source_data['archived_date'] = history_item.get('date')
                                     archived_sources[source_name] = source_data
-                                    logger.info(f"Added array source to archived_sources: {source_name}")
+                                    logger.info("Added array source to archived_sources: %s", source_name)
                         else:
                             source_count = len(hist_sources) if hist_sources else 0
-                            logger.info(f"Found {source_count} sources in object format")
+                            logger.info("Found %s sources in object format", source_count)
                             
                             for source_name, source_data in hist_sources.items():
                                 # If source_data is a simple URL string, convert to object
@@ -621,18 +701,18 @@ def get_tracked_query_details(query_id):
                                         "link": source_data,
                                         "archived_date": history_item.get('date')
                                     }
-                                    logger.info(f"Converted string source to object: {source_name}")
+                                    logger.info("Converted string source to object: %s", source_name)
                                 # If it's already an object, add archived_date
                                 elif source_data and isinstance(source_data, dict):
                                     source_data = dict(source_data)  # Create a copy
                                     source_data['archived_date'] = history_item.get('date')
-                                    logger.info(f"Added archived_date to source object: {source_name}")
+                                    logger.info("Added archived_date to source object: %s", source_name)
                                     
                                 archived_sources[source_name] = source_data
                     
                     # Add archived sources if any exist
                     source_count = len(archived_sources)
-                    logger.info(f"Total archived sources collected: {source_count}")
+                    logger.info("Total archived sources collected: %s", source_count)
                     if archived_sources:
                         result_query['archived_sources'] = archived_sources
                     
@@ -641,7 +721,7 @@ def get_tracked_query_details(query_id):
                         del result_query['tracking_history']
                         logger.info("Removed tracking_history from response")
             except Exception as e:
-                logger.error(f"Error transforming tracking history: {str(e)}", exc_info=True)
+                logger.error("Error transforming tracking history: %s", e, exc_info=True)
                 # If transformation fails, return the original query with tracking_history
         
         return jsonify({
@@ -650,7 +730,7 @@ def get_tracked_query_details(query_id):
         })
         
     except Exception as e:
-        logger.error(f"Error retrieving tracked query details: {str(e)}")
+        logger.error("Error retrieving tracked query details: %s", e)
         return jsonify({
             'success': False,
             'error': 'An error occurred while retrieving tracked query details',
@@ -693,7 +773,7 @@ def create_tracked_query():
         }), 400
     
     try:
-        from datetime import datetime
+        from datetime import datetime, timezone
         
         # Get the news agent to perform the initial query
         agent = get_news_agent()
@@ -714,7 +794,7 @@ def create_tracked_query():
         
         # Perform the initial tracking query
         try:
-            logger.info(f"Performing initial tracking query: '{query}'")
+            logger.info("Performing initial tracking query: '%s'", query)
             result = agent.generate_response(query)
             
             # Extract response and sources
@@ -722,10 +802,11 @@ def create_tracked_query():
             sources = result.get('sources', {})
             
             # Create initial tracking history entry
-            now = datetime.utcnow()
+            now = datetime.now(timezone.utc)
             initial_history = [{
                 'date': now,
                 'summary': summary,
+                'summary_lines': summary.splitlines(),
                 'sources': sources,
                 'changes': None  # No changes for the first entry
             }]
@@ -744,7 +825,7 @@ def create_tracked_query():
             result = tracked_queries_collection.insert_one(new_tracked_query)
             query_id = result.inserted_id
             
-            logger.info(f"Created tracked query with ID: {query_id} for user_id: {user_id} with initial tracking data")
+            logger.info("Created tracked query with ID: %s for user_id: %s with initial tracking data", query_id, user_id)
             
             return jsonify({
                 'success': True,
@@ -753,22 +834,23 @@ def create_tracked_query():
             })
             
         except Exception as e:
-            logger.error(f"Error performing initial tracking query: {str(e)}")
+            logger.error("Error performing initial tracking query: %s", e)
             
             # If the tracking query fails, still create the document but without any history
+            now = datetime.now(timezone.utc)
             new_tracked_query = {
                 "user_id": user_id,
                 "query": query,
                 "is_active": True,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow(),
+                "created_at": now,
+                "updated_at": now,
                 "tracking_history": []  # Empty history
             }
             
             # Insert the document
             result = tracked_queries_collection.insert_one(new_tracked_query)
             
-            logger.info(f"Created tracked query with ID: {result.inserted_id} for user_id: {user_id} (without initial tracking)")
+            logger.info("Created tracked query with ID: %s for user_id: %s (without initial tracking)", result.inserted_id, user_id)
             
             return jsonify({
                 'success': True,
@@ -778,7 +860,7 @@ def create_tracked_query():
             })
         
     except Exception as e:
-        logger.error(f"Error creating tracked query: {str(e)}")
+        logger.error("Error creating tracked query: %s", e)
         return jsonify({
             'success': False,
             'error': 'An error occurred while creating the tracked query',
@@ -816,7 +898,6 @@ def delete_tracked_query(query_id):
         }), 400
     
     try:
-        from bson import ObjectId
         
         # Get the news_tracker database from the same MongoDB cluster
         db_name = "news_tracker"
@@ -828,9 +909,8 @@ def delete_tracked_query(query_id):
         tracked_queries_collection = news_tracker_db[collection_name]
         
         # Check if the query_id is a valid ObjectId
-        try:
-            query_obj_id = ObjectId(query_id)
-        except Exception:
+        query_obj_id = _to_oid(query_id)
+        if query_obj_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid query ID format'
@@ -854,7 +934,7 @@ def delete_tracked_query(query_id):
         })
         
     except Exception as e:
-        logger.error(f"Error deleting tracked query: {str(e)}")
+        logger.error("Error deleting tracked query: %s", e)
         return jsonify({
             'success': False,
             'error': 'An error occurred while deleting the tracked query',
@@ -892,8 +972,7 @@ def update_tracked_query(query_id):
         }), 400
     
     try:
-        from bson import ObjectId
-        from datetime import datetime
+        from datetime import datetime, timezone
         import difflib
         
         # Get the news agent to perform the query
@@ -913,20 +992,26 @@ def update_tracked_query(query_id):
         news_tracker_db = mongo_client[db_name]
         tracked_queries_collection = news_tracker_db[collection_name]
         
-        # Check if the query_id is valid
-        try:
-            query_obj_id = ObjectId(query_id)
-        except Exception:
+        # Check if the query_id is a valid ObjectId
+        query_obj_id = _to_oid(query_id)
+        if query_obj_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid query ID format'
             }), 400
         
-        # Find the tracked query document
-        tracked_query = tracked_queries_collection.find_one({
-            "_id": query_obj_id,
-            "user_id": user_id
-        })
+        # Find the tracked query document with only its latest history entry. Sorted server-side rather
+        # than trusting array order: older documents (and other writers) append oldest-first
+        tracked_query = tracked_queries_collection.find_one(
+            {"_id": query_obj_id, "user_id": user_id},
+            {
+                "query": 1,
+                "tracking_history": {"$slice": [
+                    {"$sortArray": {"input": {"$ifNull": ["$tracking_history", []]}, "sortBy": {"date": -1}}},
+                    1
+                ]}
+            }
+        )
         
         if not tracked_query:
             return jsonify({
@@ -945,13 +1030,16 @@ def update_tracked_query(query_id):
         # Get the previous summary if available
         tracking_history = tracked_query.get('tracking_history', [])
         previous_summary = None
+        previous_summary_lines = None
         if tracking_history:
-            # Sort by date to get the most recent
-            sorted_history = sorted(tracking_history, key=lambda x: x.get('date', ''), reverse=True)
-            previous_summary = sorted_history[0].get('summary', '')
+            previous_summary = tracking_history[0].get('summary', '')
+            # Older entries were stored without the pre-split lines
+            previous_summary_lines = tracking_history[0].get('summary_lines')
+            if previous_summary_lines is None:
+                previous_summary_lines = previous_summary.splitlines()
         
         # Perform the tracking query
-        logger.info(f"Performing manual tracking update for query: '{query_text}'")
+        logger.info("Performing manual tracking update for query: '%s'", query_text)
         result = agent.generate_response(query_text)
         
         # Extract response and sources
@@ -959,9 +1047,10 @@ def update_tracked_query(query_id):
         sources = result.get('sources', {})
         
         # Calculate changes if previous summary exists
+        new_summary_lines = new_summary.splitlines()
         changes = None
         if previous_summary:
-            diff = difflib.ndiff(previous_summary.splitlines(), new_summary.splitlines())
+            diff = difflib.ndiff(previous_summary_lines, new_summary_lines)
             added = []
             removed = []
             
@@ -977,24 +1066,25 @@ def update_tracked_query(query_id):
             }
         
         # Create new tracking history entry
-        now = datetime.utcnow()
+        now = datetime.now(timezone.utc)
         new_history_entry = {
             'date': now,
             'summary': new_summary,
+            'summary_lines': new_summary_lines,
             'sources': sources,
             'changes': changes
         }
         
-        # Update the document with new tracking entry
+        # Update the document with new tracking entry, keeping the history sorted newest-first
         tracked_queries_collection.update_one(
             {"_id": query_obj_id},
             {
-                "$push": {"tracking_history": new_history_entry},
+                "$push": {"tracking_history": {"$each": [new_history_entry], "$sort": {"date": -1}}},
                 "$set": {"updated_at": now}
             }
         )
         
-        logger.info(f"Updated tracked query with ID: {query_id} for user_id: {user_id}")
+        logger.info("Updated tracked query with ID: %s for user_id: %s", query_id, user_id)
         
         return jsonify({
             'success': True,
@@ -1005,7 +1095,7 @@ def update_tracked_query(query_id):
         })
         
     except Exception as e:
-        logger.error(f"Error updating tracked query: {str(e)}")
+        logger.error("Error updating tracked query: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to update tracked query',
@@ -1047,8 +1137,7 @@ def toggle_tracked_query_status(query_id):
     is_active = data.get('is_active')
     
     try:
-        from bson import ObjectId
-        from datetime import datetime
+        from datetime import datetime, timezone
         
         # Get the news_tracker database
         db_name = "news_tracker"
@@ -1059,10 +1148,9 @@ def toggle_tracked_query_status(query_id):
         news_tracker_db = mongo_client[db_name]
         tracked_queries_collection = news_tracker_db[collection_name]
         
-        # Check if the query_id is valid
-        try:
-            query_obj_id = ObjectId(query_id)
-        except Exception:
+        # Check if the query_id is a valid ObjectId
+        query_obj_id = _to_oid(query_id)
+        if query_obj_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid query ID format'
@@ -1090,13 +1178,13 @@ def toggle_tracked_query_status(query_id):
             {
                 "$set": {
                     "is_active": new_status,
-                    "updated_at": datetime.utcnow()
+                    "updated_at": datetime.now(timezone.utc)
                 }
             }
         )
         
         status_text = "activated" if new_status else "deactivated"
-        logger.info(f"Tracked query {query_id} {status_text} for user_id: {user_id}")
+        logger.info("Tracked query %s %s for user_id: %s", query_id, status_text, user_id)
         
         return jsonify({
             'success': True,
@@ -1106,7 +1194,7 @@ def toggle_tracked_query_status(query_id):
         })
         
     except Exception as e:
-        logger.error(f"Error toggling tracked query status: {str(e)}")
+        logger.error("Error toggling tracked query status: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to toggle tracked query status',
@@ -37,28 +37,51 @@ def search_conversations():
         }), 400
     
     try:
-        logger.info(f"Searching for '{query}' in conversations for user_id: {user_id}")
+        logger.info("Searching for '%s' in conversations for user_id: %s", query, user_id)
         
-        # Create regex pattern for case-insensitive search
-        pattern = re.compile(f'.*{re.escape(query)}.*', re.IGNORECASE)
+        # Create regex pattern for case-insensitive substring search. No leading/trailing '.*':
+        # an unanchored regex already matches anywhere, and the wildcards only add backtracking.
+        # The user_id equality is served by the (user_id, session_id) index, so the regex
+        # is only evaluated against this user's sessions.
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
         
-        # Search for the query in titles and message content
-        results = mongo.db.chat_sessions.find({
+        # Title matches (and messages still embedded in sessions created before chat_messages)
+        sessions = {}
+        for session in mongo.db.chat_sessions.find({
             "user_id": user_id,
             "$or": [
                 {"title": {"$regex": pattern}},
                 {"messages.content": {"$regex": pattern}}
             ]
         }, {
+            "_id": 0,
             "session_id": 1,
             "title": 1, 
             "created_at": 1,
             "messages": 1
-        })
+        }):
+            sessions[session["session_id"]] = session
+        
+        # Message matches, restricted to this user's sessions
+        session_ids = mongo.db.chat_sessions.distinct("session_id", {"user_id": user_id})
+        matched_by_session = {}
+        for msg in mongo.db.chat_messages.find({
+            "session_id": {"$in": session_ids},
+            "content": {"$regex": pattern}
+        }, {"_id": 0, "session_id": 1, "role": 1, "content": 1, "timestamp": 1}).sort("timestamp", 1):
+            matched_by_session.setdefault(msg["session_id"], []).append(msg)
+        
+        missing = [sid for sid in matched_by_session if sid not in sessions]
+        if missing:
+            for session in mongo.db.chat_sessions.find(
+                {"session_id": {"$in": missing}},
+                {"_id": 0, "session_id": 1, "title": 1, "created_at": 1}
+            ):
+                sessions[session["session_id"]] = session
         
         # Format the results
         formatted_results = []
-        for session in results:
+        for session in sessions.values():
             # Format session data
             session_data = {
                 "session_id": session["session_id"],
@@ -68,9 +91,10 @@ def search_conversations():
             }
             
             # Find matching messages
-            for msg in session.get("messages", []):
+            candidates = session.get("messages", []) + matched_by_session.get(session["session_id"], [])
+            for msg in candidates:
                 content = msg.get("content", "")
-                if re.search(pattern, content):
+                if pattern.search(content):
                     # Add matched message with limited preview
                     preview = content[:100] + "..." if len(content) > 100 else content
                     session_data["matched_messages"].append({
@@ -82,14 +106,17 @@ def search_conversations():
             # Add to results even if no messages matched (title match)
             formatted_results.append(session_data)
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'results': formatted_results,
             'count': len(formatted_results)
         })
+        # Let polling clients revalidate with If-None-Match and get an empty 304
+        response.add_etag()
+        return response.make_conditional(request)
         
     except Exception as e:
-        logger.error(f"Error searching conversations: {str(e)}")
+        logger.error("Error searching conversations: %s", e)
         return jsonify({
             'success': False,
             'error': 'An error occurred while searching conversations',
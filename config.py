@@ -7,13 +7,18 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'hi_stalkers')
     MONGO_URI = os.getenv('MONGO_URI')
+    # Connection pool: a small warm pool instead of pymongo's default of up to 100 sockets per process
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 20))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 5))
+    # Chat sessions idle longer than this are deleted (with their messages) by a MongoDB TTL index
+    SESSION_RETENTION_DAYS = int(os.getenv('SESSION_RETENTION_DAYS', 90))
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
     NEWS_API_KEY = os.getenv('NEWS_API_KEY')
     GOOGLE_OAUTH_CLIENT_ID = os.getenv('GOOGLE_OAUTH_CLIENT_ID')
     GOOGLE_OAUTH_CLIENT_SECRET = os.getenv('GOOGLE_OAUTH_CLIENT_SECRET')
-    BRAVE_API_KEY = os.environ.get('BRAVE_API_KEY'),
-    GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY'),
-    SERPER_API_KEY = os.environ.get('SERPER_API_KEY'),
-    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO'),
-    API_KEY = os.environ.get('API_KEY'),
+    BRAVE_API_KEY = os.environ.get('BRAVE_API_KEY')
+    GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+    SERPER_API_KEY = os.environ.get('SERPER_API_KEY')
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    API_KEY = os.environ.get('API_KEY')
     DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() in ('true', '1', 't')
\ No newline at end of file
@@ -1,6 +1,109 @@
 # extensions.py
+import logging
+import orjson
+from flask.json.provider import JSONProvider, DefaultJSONProvider
 from flask_pymongo import PyMongo
 from flask_jwt_extended import JWTManager
+from bson import ObjectId
+from pymongo.errors import ConnectionFailure, OperationFailure
+
+logger = logging.getLogger(__name__)
 
 mongo = PyMongo()
 jwt = JWTManager()
+
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson, used by jsonify() and request.get_json()."""
+
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+    @staticmethod
+    def default(o):
+        # orjson already handles datetime, UUID and dataclasses natively
+        if isinstance(o, ObjectId):
+            return str(o)
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def _ensure_ttl_index(collection, field, expire_after_seconds):
+    """Create a TTL index on `field`, or update its expiry if the retention period changed."""
+    try:
+        collection.create_index([(field, 1)], expireAfterSeconds=expire_after_seconds)
+    except OperationFailure as e:
+        if e.code != 85:  # IndexOptionsConflict: same key, different expireAfterSeconds
+            raise
+        collection.database.command(
+            "collMod", collection.name,
+            index={"keyPattern": {field: 1}, "expireAfterSeconds": expire_after_seconds}
+        )
+
+
+def _drop_ttl_index(collection, field):
+    """Drop a TTL index on `field` if one exists."""
+    for name, info in collection.index_information().items():
+        if info.get("key") == [(field, 1)] and "expireAfterSeconds" in info:
+            collection.drop_index(name)
+
+
+def ensure_indexes(retention_days=90):
+    """Create the indexes the hot query paths rely on. Safe to call on every startup.
+    
+    Args:
+        retention_days (int): Chat sessions idle this long are deleted by MongoDB's TTL
+            monitor; their messages are removed by the `purge-orphaned-messages` command
+            
+    Returns:
+        list: Names of the steps that failed (each is also logged)
+    """
+    tracked_queries = mongo.cx["news_tracker"]["tracked_queries"]
+    chat_sessions = mongo.db.chat_sessions
+    chat_messages = mongo.db.chat_messages
+    retention_seconds = retention_days * 24 * 60 * 60
+
+    def drop_superseded_session_list_index():
+        if "user_id_1_created_at_-1" in chat_sessions.index_information():
+            chat_sessions.drop_index("user_id_1_created_at_-1")
+
+    # Each step runs on its own, so one failing index (e.g. duplicates blocking a unique index)
+    # doesn't leave every index after it uncreated
+    steps = [
+        ("tracked_queries (user_id, _id)", lambda: tracked_queries.create_index([("user_id", 1), ("_id", 1)])),
+        # Lets the scheduler's active-query scans skip paused documents
+        ("tracked_queries user_id_active", lambda: tracked_queries.create_index(
+            [("user_id", 1)],
+            name="user_id_active",
+            partialFilterExpression={"is_active": True}
+        )),
+        ("chat_sessions unique session_id", lambda: chat_sessions.create_index([("session_id", 1)], unique=True)),
+        ("chat_sessions (user_id, session_id)", lambda: chat_sessions.create_index([("user_id", 1), ("session_id", 1)])),
+        # session_id breaks created_at ties in list_sessions' keyset pagination
+        ("chat_sessions (user_id, created_at, session_id)", lambda: chat_sessions.create_index(
+            [("user_id", 1), ("created_at", -1), ("session_id", -1)]
+        )),
+        ("drop superseded chat_sessions (user_id, created_at)", drop_superseded_session_list_index),
+        ("chat_messages (session_id, timestamp)", lambda: chat_messages.create_index([("session_id", 1), ("timestamp", 1)])),
+        ("chat_sessions last_activity_at TTL", lambda: _ensure_ttl_index(chat_sessions, "last_activity_at", retention_seconds)),
+        # Messages only expire with their session; a TTL on their own timestamp would delete
+        # the early turns of live sessions (and freshly migrated legacy history)
+        ("drop chat_messages timestamp TTL", lambda: _drop_ttl_index(chat_messages, "timestamp")),
+    ]
+    failed = []
+    for i, (name, step) in enumerate(steps):
+        try:
+            step()
+        except ConnectionFailure as e:
+            # Server unreachable: every remaining step would just wait out the same timeout
+            failed.extend(n for n, _ in steps[i:])
+            logger.error("Error creating MongoDB indexes, server unreachable: %s", e)
+            break
+        except Exception as e:
+            failed.append(name)
+            logger.error("Error creating MongoDB index %s: %s", name, e)
+    return failed
@@ -1,56 +1,202 @@
-import os
 import logging
 from typing import List, Dict, Any, Optional
-from datetime import datetime
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.agents import AgentExecutor, create_react_agent
-from langchain.prompts import PromptTemplate
-from langchain.tools import Tool
-from langchain.chains import LLMChain
-from langchain_core.prompts import MessagesPlaceholder
-from langchain_core.messages import AIMessage, HumanMessage
-from langchain.agents.format_scratchpad import format_to_openai_function_messages
-from langchain.agents.output_parsers import ReActSingleInputOutputParser
-import json
+# LangChain and the Gemini SDK are imported inside the functions that use them; pulling them in
+# (grpc, protobuf, pydantic shims) takes seconds and would otherwise delay worker cold starts.
+import re
+import orjson
+import asyncio
+import functools
+import threading
+import weakref
+from collections import deque
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import requests
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
+
+# Per-request holder for the results of async searches. generate_response_async puts a fresh list here
+# before invoking the agent; tool coroutines run in child tasks but share the same list object.
+_async_last_results: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("_async_last_results", default=None)
+
 class SerperNewsSearchTool:
+    # Same query asked within a few minutes (often by different sessions) shares one Serper round-trip
+    _cache = TTLCache(maxsize=512, ttl=180)
+    _cache_lock = threading.Lock()
+    # Speculative searches started before the agent asks for them, keyed like the cache
+    _inflight = {}
+    _PREFETCH_WORKERS = 4
+    _prefetch_executor = ThreadPoolExecutor(max_workers=_PREFETCH_WORKERS, thread_name_prefix="serper-prefetch")
+
     def __init__(self, api_key):
-        if isinstance(api_key, tuple):
-            self.api_key = api_key[0]
-        else:
-            self.api_key = api_key
-        print(self.api_key)
+        self.api_key = api_key
         self.headers = {
             'X-API-KEY': str(self.api_key),
             'Content-Type': 'application/json'
         }
         self.url = "https://google.serper.dev/search" # goes and searches here(whatever query you perform)
+
+        # Reuse keep-alive connections to Serper instead of a new TCP+TLS handshake per query
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None)
+        )
+        self.session.mount("https://", adapter)
+
+        # HTTP/2 client for batch searches: concurrent requests are multiplexed over one connection
+        self._http2 = httpx.Client(
+            http2=True,
+            headers=self.headers,
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=5)
+        )
+
+        # Results of the most recent search made on the current thread (i.e. by the agent for this request)
+        self._local = threading.local()
+
+        # httpx clients are bound to the event loop they were created on, so keep one per loop
+        self._aclients = weakref.WeakKeyDictionary()
+
+    @property
+    def last_results(self) -> List[Dict[str, Any]]:
+        """Results of the last search performed on the calling thread."""
+        return getattr(self._local, "last_results", [])
+
+    def reset_last_results(self):
+        """Forget the last search results for the calling thread."""
+        self._local.last_results = []
     
-    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    def search(self, query: str, limit: int = 5, http2: bool = False) -> List[Dict[str, Any]]:
         """
         Args:
             query (str): The search query
             limit (int): Maximum number of results to return  
+            http2 (bool): Send the request over the shared HTTP/2 client instead of the keep-alive session
         Returns:
             List[Dict[str, Any]]: List of news articles
         """
-        import requests
+        key = self._cache_key(query, limit)
+        with self._cache_lock:
+            results = self._cache.get(key)
+            pending = self._inflight.get(key)
         
-        try:
-            payload = json.dumps({
-                "q": query,
-                "search_type": "news" 
-            })
-            response = requests.request("POST", self.url, headers=self.headers, data=payload)
-            response.raise_for_status()
-            data = response.json()
-            results = data.get("organic", []) #use 'organic' instead of 'news'
-            return results[:limit]
-            
-        except Exception as e:
-            logger.error(f"Error searching news with Serper: {e}")
-            return []
+        if results is None and pending is not None:
+            if pending.cancel():
+                # Still queued behind other prefetches: fetch directly rather than wait for a worker
+                pending = None
+            else:
+                # A prefetch for this query is already on the wire, wait for it instead of asking again
+                try:
+                    results = pending.result(timeout=10)
+                except Exception as e:
+                    logger.warning("Prefetched search failed, searching directly: %s", e)
+        
+        if results is None:
+            try:
+                results = self._fetch(query, limit, key, http2)
+            except Exception as e:
+                logger.error("Error searching news with Serper: %s", e)
+                return []
+        
+        self._local.last_results = results
+        return results
+
+    def prefetch(self, query: str, limit: int = 5):
+        """Start searching for query in the background so a later search() can pick up the result."""
+        key = self._cache_key(query, limit)
+        with self._cache_lock:
+            if key in self._cache or key in self._inflight:
+                return
+            # Every worker is busy: a queued prefetch would only finish after the agent needs it
+            if len(self._inflight) >= self._PREFETCH_WORKERS:
+                return
+            future = self._prefetch_executor.submit(self._fetch, query, limit, key)
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._discard_inflight(key))
+
+    def _discard_inflight(self, key):
+        with self._cache_lock:
+            self._inflight.pop(key, None)
+
+    def _fetch(self, query: str, limit: int, key, http2: bool = False) -> List[Dict[str, Any]]:
+        """Call Serper and cache the results. Raises on HTTP errors."""
+        payload = orjson.dumps({
+            "q": query,
+            "search_type": "news" 
+        })
+        if http2:
+            response = self._http2.post(self.url, content=payload)
+        else:
+            response = self.session.post(self.url, data=payload, timeout=10)
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        results = data.get("organic", [])[:limit] #use 'organic' instead of 'news'
+        
+        with self._cache_lock:
+            self._cache[key] = results
+        return results
+
+    @staticmethod
+    def _cache_key(query: str, limit: int):
+        """Normalize a query so trivially different spellings share a cache entry."""
+        return (query.strip().lower(), limit)
+
+    def _get_aclient(self) -> httpx.AsyncClient:
+        """Return the async HTTP/2 client for the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                http2=True,
+                headers=self.headers,
+                timeout=10.0,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+            )
+            self._aclients[loop] = client
+        return client
+
+    async def asearch(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Async version of search().
+
+        Args:
+            query (str): The search query
+            limit (int): Maximum number of results to return
+        Returns:
+            List[Dict[str, Any]]: List of news articles
+        """
+        key = self._cache_key(query, limit)
+        with self._cache_lock:
+            results = self._cache.get(key)
+
+        if results is None:
+            try:
+                payload = orjson.dumps({
+                    "q": query,
+                    "search_type": "news"
+                })
+                response = await self._get_aclient().post(self.url, content=payload)
+                response.raise_for_status()
+                results = orjson.loads(response.content).get("organic", [])[:limit]
+
+            except Exception as e:
+                logger.error("Error searching news with Serper: %s", e)
+                return []
+
+            with self._cache_lock:
+                self._cache[key] = results
+
+        bucket = _async_last_results.get()
+        if bucket is not None:
+            bucket[:] = results
+        return results
     
     """
     Call here acts as the bridge between langchain 
@@ -65,7 +211,81 @@ class SerperNewsSearchTool:
         if not results:
             return "No news articles found for the query."
         
-        formatted_results = "Here are the latest news articles I found:\n\n"
+        return self._format_results(results)
+
+    def batch_search(self, queries: List[str], limit: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Run several searches concurrently, multiplexed over a single HTTP/2 connection.
+
+        Args:
+            queries (List[str]): The search queries
+            limit (int): Maximum number of results to return per query
+        Returns:
+            List[List[Dict[str, Any]]]: Results for each query, in the same order
+        """
+        if not queries:
+            return []
+        with ThreadPoolExecutor(max_workers=min(8, len(queries))) as executor:
+            results = list(executor.map(lambda q: self.search(q, limit, http2=True), queries))
+        # The searches ran on worker threads, so record the combined results for the caller
+        self._local.last_results = [article for batch in results for article in batch]
+        return results
+
+    def batch_call(self, queries_json: str) -> str:
+        """LangChain entry point for NewsSearchBatch: takes a JSON array of queries, returns formatted text."""
+        try:
+            queries = orjson.loads(queries_json)
+        except ValueError:
+            queries = None
+        if not isinstance(queries, list):
+            # The model did not send a JSON array, treat the input as a single query
+            return self(queries_json)
+
+        queries = [str(q) for q in queries if q]
+        sections = []
+        for query, results in zip(queries, self.batch_search(queries)):
+            if results:
+                sections.append(f"Results for '{query}':\n{self._format_results(results)}")
+            else:
+                sections.append(f"Results for '{query}':\nNo news articles found for the query.\n\n")
+        return "".join(sections) or "No news articles found for the query."
+
+    async def acall(self, query: str) -> str:
+        """Async version of __call__ for the agent's ainvoke path."""
+        results = await self.asearch(query)
+
+        if not results:
+            return "No news articles found for the query."
+
+        return self._format_results(results)
+
+    async def abatch_call(self, queries_json: str) -> str:
+        """Async version of batch_call; the searches are awaited concurrently."""
+        try:
+            queries = orjson.loads(queries_json)
+        except ValueError:
+            queries = None
+        if not isinstance(queries, list):
+            return await self.acall(queries_json)
+
+        queries = [str(q) for q in queries if q]
+        batches = await asyncio.gather(*(self.asearch(q) for q in queries))
+        bucket = _async_last_results.get()
+        if bucket is not None:
+            bucket[:] = [article for batch in batches for article in batch]
+
+        sections = []
+        for query, results in zip(queries, batches):
+            if results:
+                sections.append(f"Results for '{query}':\n{self._format_results(results)}")
+            else:
+                sections.append(f"Results for '{query}':\nNo news articles found for the query.\n\n")
+        return "".join(sections) or "No news articles found for the query."
+
+    @staticmethod
+    def _format_results(results: List[Dict[str, Any]]) -> str:
+        """Format search results as a numbered list for the agent."""
+        parts = ["Here are the latest news articles I found:\n\n"]
         
         for i, article in enumerate(results, 1):
             title = article.get("title", "No title")
@@ -73,19 +293,128 @@ class SerperNewsSearchTool:
             source = article.get("source", "Unknown source")
             date = article.get("date", "")
             snippet = article.get("snippet", "No description available")
-            formatted_results += f"{i}. **{title}**\n"
-            formatted_results += f"   Source: {source}"
-            if date:
-                formatted_results += f" | {date}"
-            formatted_results += f"\n   {snippet}\n"
-            formatted_results += f"   Link: {link}\n\n"
+            date_part = f" | {date}" if date else ""
+            parts.append(
+                f"{i}. **{title}**\n"
+                f"   Source: {source}{date_part}\n"
+                f"   {snippet}\n"
+                f"   Link: {link}\n\n"
+            )
         
-        return formatted_results
+        return "".join(parts)
     
 
 
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationChain
+# Number of past user/assistant exchanges included in the prompt
+HISTORY_WINDOW_TURNS = 5
+
+# ReAct prompt template with the correct format and chat history.
+# Everything before the chat history is identical on every turn, so the per-turn
+# parts stay at the end where they don't break the provider's prefix caching.
+_PROMPT_TEMPLATE = """You are a helpful news assistant that can search for and summarize recent news.
+Always be conversational and friendly in your responses.
+
+When finding news:
+1. Search for the most relevant news articles
+2. Summarize the key points
+3. Add your own insights about the news
+4. Be concise yet informative
+5. If the question contains multiple independent sub-topics, call NewsSearchBatch with a JSON array of queries
+
+Available tools: {tools}
+
+Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Begin!
+
+Previous conversation history:
+{chat_history}
+
+Question: {input}
+{agent_scratchpad}"""
+
+
+# (name, sync method, async method, description) for each agent tool; only the bound methods vary per instance
+_TOOL_SPECS = (
+    (
+        "NewsSearch", "__call__", "acall",
+        "Useful for searching and finding recent news articles on specific topics. Input should be a search query."
+    ),
+    (
+        "NewsSearchBatch", "batch_call", "abatch_call",
+        "Useful for searching news on several independent topics at once. Input should be a JSON array of search queries, e.g. [\"India news\", \"Pakistan news\"]."
+    ),
+)
+
+
+@functools.cache
+def _get_prompt():
+    """Parse the ReAct prompt template once per process."""
+    from langchain.prompts import PromptTemplate
+
+    return PromptTemplate.from_template(_PROMPT_TEMPLATE)
+
+
+@functools.lru_cache(maxsize=8)
+def _get_llm(api_key: str, model: str, temperature: float):
+    """Return a shared Gemini chat model for this (key, model, temperature) combination."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=model,
+        GOOGLE_API_KEY=api_key,
+        temperature=temperature,
+        convert_system_message_to_human=True
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _get_search_tool(api_key: str) -> SerperNewsSearchTool:
+    """Return a shared Serper tool per API key so its pooled HTTP session is reused."""
+    return SerperNewsSearchTool(api_key=api_key)
+
+@functools.lru_cache(maxsize=8)
+def _get_agent_executor(google_api_key: str, serper_api_key: str):
+    """Build the ReAct agent executor once per key pair.
+
+    The executor holds no conversation state; chat history is passed in on every invoke."""
+    from langchain.agents import AgentExecutor, create_react_agent
+    from langchain.tools import Tool
+
+    llm = _get_llm(google_api_key, "gemini-1.5-flash", 0.7)
+    search_tool = _get_search_tool(serper_api_key)
+    tools = [
+        Tool(
+            name=name,
+            func=getattr(search_tool, func),
+            coroutine=getattr(search_tool, coroutine),
+            description=description
+        )
+        for name, func, coroutine, description in _TOOL_SPECS
+    ]
+
+    agent = create_react_agent(
+        llm=llm,
+        tools=tools,
+        prompt=_get_prompt()
+    )
+
+    return AgentExecutor.from_agent_and_tools(
+        agent=agent,
+        tools=tools,
+        verbose=True,
+        handle_parsing_errors=True,
+        max_iterations=3
+    )
 
 """
 Integrates langchain,google gemini and serper api 
@@ -93,109 +422,100 @@ Integrates langchain,google gemini and serper api
 class NewsAgentService:
     """Service that provides a conversational news agent using LangChain, Gemini, and Serper."""
     
+    # Plain "news on X" questions that can skip the ReAct loop: search once, summarize with one LLM call
+    _fast_path_pattern = re.compile(r"^(latest|recent|news about|what's happening in|headlines on)\s+(.+)", re.I)
+    # Short keyword queries ("tesla earnings") that the agent tends to search verbatim
+    _PREFETCH_MAX_WORDS = 6
+    _question_pattern = re.compile(r"^(what|why|how|who|when|where|which|is|are|can|could|should|will|would|do|does|did|tell|explain)\b|\?", re.I)
+    
     def __init__(self, GOOGLE_API_KEY: str, serper_api_key: str):
+        from langchain.memory import ConversationBufferMemory
+
         self.GOOGLE_API_KEY = GOOGLE_API_KEY
         self.serper_api_key = serper_api_key
         
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash",
-            GOOGLE_API_KEY=self.GOOGLE_API_KEY,
-            temperature=0.7,
-            convert_system_message_to_human=True
-        )
+        # The LLM, tools and agent executor are stateless and shared process-wide
+        self.llm = _get_llm(self.GOOGLE_API_KEY, "gemini-1.5-flash", 0.7)
+        self.search_tool = _get_search_tool(self.serper_api_key)
+        self.agent_executor = _get_agent_executor(self.GOOGLE_API_KEY, self.serper_api_key)
+        self.agent = self.agent_executor.agent
+        self.tools = self.agent_executor.tools
 
-        self.search_tool = SerperNewsSearchTool(api_key=self.serper_api_key)
+        # Per-instance state. The full message list backs the /history route; only the last few
+        # exchanges, kept pre-formatted in a ring buffer, are rendered into the prompt.
+        self.memory = ConversationBufferMemory()
+        self._history_lines = deque(maxlen=2 * HISTORY_WINDOW_TURNS)
 
-        self.tools = [
-            Tool(
-                name="NewsSearch",
-                func=self.search_tool,
-                description="Useful for searching and finding recent news articles on specific topics. Input should be a search query."
-            )
-        ]
+    def add_user_message(self, content: str):
+        """Record a user message in the conversation history."""
+        self.memory.chat_memory.add_user_message(content)
+        self._history_lines.append(f"User: {content}")
 
-        self.memory = ConversationBufferMemory()
-        self.conversation = ConversationChain(
-            llm=self.llm,
-            memory=self.memory,
-            verbose=True
-        )
+    def add_ai_message(self, content: str):
+        """Record an assistant message in the conversation history."""
+        self.memory.chat_memory.add_ai_message(content)
+        self._history_lines.append(f"Assistant: {content}")
 
-        self._create_agent()
-    
-    def _create_agent(self):
-        """Create the LangChain agent with the appropriate prompt."""
-        
-        # prompt template with the correct ReAct format and chat history
-        prompt = PromptTemplate.from_template(
-            """You are a helpful news assistant that can search for and summarize recent news.
-            Always be conversational and friendly in your responses.
-            
-            When finding news:
-            1. Search for the most relevant news articles
-            2. Summarize the key points
-            3. Add your own insights about the news
-            4. Be concise yet informative            
-            Previous conversation history:
-            {chat_history}
-            
-            Available tools: {tools}
-            
-            Use the following format:
-            
-            Question: the input question you must answer
-            Thought: you should always think about what to do
-            Action: the action to take, should be one of [{tool_names}]
-            Action Input: the input to the action
-            Observation: the result of the action
-            ... (this Thought/Action/Action Input/Observation can repeat N times)
-            Thought: I now know the final answer
-            Final Answer: the final answer to the original input question
-            
-            Begin!
-            
-            Question: {input}
-            {agent_scratchpad}"""
-        )
+    def _fast_path_messages(self, query: str, chat_history: str, results: List[Dict[str, Any]]):
+        """Build the single summarization prompt used by the fast path."""
+        from langchain_core.messages import SystemMessage, HumanMessage
 
-        self.agent = create_react_agent(
-            llm=self.llm,
-            tools=self.tools,
-            prompt=prompt
-        )
+        return [
+            SystemMessage(content=(
+                "You are a helpful news assistant. Summarize the key points of the news articles below, "
+                "add your own insights, and be conversational, concise and informative."
+            )),
+            HumanMessage(content=(
+                f"Previous conversation history:\n{chat_history}\n\n"
+                f"Summarize:\n{self.search_tool._format_results(results)}\n"
+                f"User question: {query}"
+            ))
+        ]
 
-        self.agent_executor = AgentExecutor.from_agent_and_tools(
-            agent=self.agent,
-            tools=self.tools,
-            verbose=True,
-            handle_parsing_errors=True,
-            max_iterations=3
-        )
+    def _should_prefetch(self, query: str) -> bool:
+        """Whether the agent is likely to search for this query exactly as typed."""
+        query = query.strip()
+        return len(query.split()) <= self._PREFETCH_MAX_WORDS and not self._question_pattern.search(query)
 
     def generate_response(self, query: str) -> Dict[str, Any]:
         """Generate a response to the user's query"""
         try:
-            # Format the conversation history in a structured way the model can understand
-            chat_history = ""
-            if self.memory.chat_memory.messages:
-                for message in self.memory.chat_memory.messages:
-                    if message.type == 'human':
-                        chat_history += f"User: {message.content}\n"
-                    else:
-                        chat_history += f"Assistant: {message.content}\n"
+            # Format the recent conversation history in a structured way the model can understand
+            chat_history = "\n".join(self._history_lines)
+            
+            # Simple "latest news on X" questions: one search and one LLM call instead of the agent loop
+            match = self._fast_path_pattern.match(query.strip())
+            if match:
+                results = self.search_tool.search(match.group(2))
+                if results:
+                    answer = self.llm.invoke(self._fast_path_messages(query, chat_history, results)).content
+                    self.add_user_message(query)
+                    self.add_ai_message(answer)
+                    return {
+                        'success': True,
+                        'response': answer,
+                        'sources': results
+                    }
+            
+            # Keyword-style queries usually become the agent's Action Input unchanged; start that search now
+            # so it overlaps with the agent's first LLM call. Questions get reworded, so a prefetch would
+            # just be an extra Serper call. An unused prefetch still backs the sources fallback below.
+            if self._should_prefetch(query):
+                self.search_tool.prefetch(query)
             
             # Execute the agent with properly formatted chat history
+            self.search_tool.reset_last_results()
             response = self.agent_executor.invoke({
                 "input": query,
                 "chat_history": chat_history
             })
             
             # Add the interaction to memory
-            self.memory.chat_memory.add_user_message(query)
-            self.memory.chat_memory.add_ai_message(response['output'])
+            self.add_user_message(query)
+            self.add_ai_message(response['output'])
             
-            # Get the latest search results from the tool
-            search_results = self.search_tool.search(query)
+            # Reuse the results the agent already fetched; only search if it never called the tool
+            search_results = self.search_tool.last_results or self.search_tool.search(query)
             
             return {
                 'success': True,
@@ -204,7 +524,54 @@ class NewsAgentService:
             }
             
         except Exception as e:
-            logger.error(f"Error generating response: {e}")
+            logger.error("Error generating response: %s", e)
+            return {
+                "success": False,
+                "response": "I'm sorry, I encountered an error while processing your request.",
+                "error": str(e)
+            }
+
+    async def generate_response_async(self, query: str) -> Dict[str, Any]:
+        """Async version of generate_response; frees the event loop during Gemini and Serper round-trips."""
+        try:
+            chat_history = "\n".join(self._history_lines)
+
+            match = self._fast_path_pattern.match(query.strip())
+            if match:
+                results = await self.search_tool.asearch(match.group(2))
+                if results:
+                    answer = (await self.llm.ainvoke(self._fast_path_messages(query, chat_history, results))).content
+                    self.add_user_message(query)
+                    self.add_ai_message(answer)
+                    return {
+                        'success': True,
+                        'response': answer,
+                        'sources': results
+                    }
+
+            searched = []
+            token = _async_last_results.set(searched)
+            try:
+                response = await self.agent_executor.ainvoke({
+                    "input": query,
+                    "chat_history": chat_history
+                })
+            finally:
+                _async_last_results.reset(token)
+
+            self.add_user_message(query)
+            self.add_ai_message(response['output'])
+
+            search_results = searched or await self.search_tool.asearch(query)
+
+            return {
+                'success': True,
+                'response': response['output'],
+                'sources': search_results
+            }
+
+        except Exception as e:
+            logger.error("Error generating response: %s", e)
             return {
                 "success": False,
                 "response": "I'm sorry, I encountered an error while processing your request.",
@@ -214,4 +581,5 @@ class NewsAgentService:
     def clear_conversation(self):
         """Clear the conversation history."""
         self.memory.clear()
+        self._history_lines.clear()
         return {"status": "Conversation history cleared"}
\ No newline at end of file
@@ -1,11 +1,121 @@
 from extensions import mongo
-from datetime import datetime
-import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError
+from cachetools import TTLCache
+from bson import ObjectId
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Service for managing chat sessions in MongoDB.
+# Session metadata lives in `chat_sessions`; each message is its own document in `chat_messages`,
+# indexed on (session_id, timestamp), so appends are O(1) inserts and reads are range scans.
+# Retention: a TTL index (see extensions.ensure_indexes) expires sessions SESSION_RETENTION_DAYS
+# after `last_activity_at`; purge_orphaned_messages then removes the messages they leave behind.
+
+# Short-lived per-process caches for the read-heavy lookups. Session metadata (never message
+# history) is keyed by session_id, and session lists by user_id (value: {(before, limit): page})
+# so one pop invalidates every page.
+_CACHE_TTL_SECONDS = 30
+_session_cache = TTLCache(maxsize=10_000, ttl=_CACHE_TTL_SECONDS)
+_session_list_cache = TTLCache(maxsize=10_000, ttl=_CACHE_TTL_SECONDS)
+_cache_lock = threading.Lock()
+
+
+# Last message timestamp handed out by this process; see _reserve_timestamps
+_last_timestamp = datetime.min.replace(tzinfo=timezone.utc)
+_clock_lock = threading.Lock()
+
+
+def _reserve_timestamps(count=1):
+    """Reserve `count` consecutive millisecond timestamps and return the first.
+    
+    Messages are ordered by timestamp and BSON dates only keep milliseconds, so rapid
+    appends (e.g. streamed chunks) could otherwise tie. One clock read per call, bumped
+    past the last reservation so timestamps strictly increase within the process."""
+    global _last_timestamp
+    now = datetime.now(timezone.utc)
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    with _clock_lock:
+        start = max(now, _last_timestamp + timedelta(milliseconds=1))
+        _last_timestamp = start + timedelta(milliseconds=count - 1)
+    return start
+
+
+def _invalidate_session(session_id, user_id=None):
+    """Drop cached copies of a session and, when the owner is known, their session list."""
+    with _cache_lock:
+        _session_cache.pop(session_id, None)
+        if user_id:
+            _session_list_cache.pop(user_id, None)
+
+
+def _touch_session(session_id, at):
+    """Record activity on a session, pushing back its TTL expiry, and drop its cached copies.
+    
+    Sent with w=0: a lost bump only means the session may expire slightly early."""
+    mongo.db.chat_sessions.with_options(write_concern=WriteConcern(w=0)).update_one(
+        {"session_id": session_id},
+        {"$max": {"last_activity_at": at}}
+    )
+    _invalidate_session(session_id)
+
+
+def backfill_last_activity():
+    """One-off migration for sessions created before `last_activity_at` existed.
+    
+    Sets it to the later of their creation time and newest embedded message, so the TTL
+    index can expire them. Run once via the `backfill-session-activity` command.
+    
+    Returns:
+        int: Number of sessions updated
+    """
+    result = mongo.db.chat_sessions.update_many(
+        {"last_activity_at": {"$exists": False}},
+        [{"$set": {"last_activity_at": {"$max": ["$created_at", {"$max": "$messages.timestamp"}]}}}]
+    )
+    return result.modified_count
+
+
+def purge_orphaned_messages(batch_size=1000):
+    """Delete messages whose session no longer exists, e.g. after the TTL index expired it.
+    
+    Scans all of chat_messages, so run it from a single scheduled job via the
+    `purge-orphaned-messages` command rather than from app workers.
+    
+    Args:
+        batch_size (int): Number of orphaned sessions whose messages are deleted per command
+        
+    Returns:
+        int: Number of messages deleted
+    """
+    deleted = 0
+    try:
+        # Walks the (session_id, timestamp) index once, joining each distinct session_id against chat_sessions
+        orphaned = mongo.db.chat_messages.aggregate([
+            {"$sort": {"session_id": 1}},
+            {"$group": {"_id": "$session_id"}},
+            {"$lookup": {"from": "chat_sessions", "localField": "_id", "foreignField": "session_id", "as": "session"}},
+            {"$match": {"session": {"$size": 0}}},
+            {"$project": {"_id": 1}}
+        ], allowDiskUse=True)
+        
+        batch = []
+        for doc in orphaned:
+            batch.append(doc["_id"])
+            if len(batch) >= batch_size:
+                deleted += mongo.db.chat_messages.delete_many({"session_id": {"$in": batch}}).deleted_count
+                batch = []
+        if batch:
+            deleted += mongo.db.chat_messages.delete_many({"session_id": {"$in": batch}}).deleted_count
+    except Exception as e:
+        logger.error("Error purging orphaned messages: %s", e)
+    if deleted:
+        logger.info("Purged %s messages from expired sessions", deleted)
+    return deleted
+
 
 def create_session(user_id, title=None):
     """Create a new chat session and return its session_id.
@@ -17,15 +127,20 @@ def create_session(user_id, title=None):
     Returns:
         str: The generated session ID
     """
-    session_id = str(uuid.uuid4())
+    # 24-char ObjectId hex: shorter than a UUID, and its time prefix makes new keys land at the
+    # right edge of the session_id indexes instead of at random leaf pages
+    session_id = str(ObjectId())
+    now = datetime.now(timezone.utc)
     session = {
         "session_id": session_id,
         "user_id": user_id,
         "title": title or "New Conversation",
-        "messages": [],
-        "created_at": datetime.utcnow()
+        "created_at": now,
+        "last_activity_at": now
     }
     mongo.db.chat_sessions.insert_one(session)
+    with _cache_lock:
+        _session_list_cache.pop(user_id, None)
     return session_id
 
 
@@ -41,40 +156,155 @@ def add_message(session_id: str, role: str, content: str, metadata=None):
     message = {
         "role": role,
         "content": content,
-        "timestamp": datetime.utcnow()
+        "timestamp": _reserve_timestamps()
     }
     
     # Add any additional metadata if provided
     if metadata:
         message.update(metadata)
+    message["session_id"] = session_id
         
-    mongo.db.chat_sessions.update_one(
-        {"session_id": session_id},
-        {"$push": {"messages": message}}
-    )
+    mongo.db.chat_messages.insert_one(message)
+    _touch_session(session_id, message["timestamp"])
 
 
-def get_messages(session_id: str, user_id=None):
-    """Retrieve all messages for a given session.
+def add_messages(session_id: str, messages):
+    """Add several messages to the session's history in a single round-trip.
     
-    If user_id is provided, ensures the session belongs to that user."""
+    Args:
+        session_id (str): The session ID
+        messages (list): Dicts with 'role' and 'content'; any other keys are stored as metadata
+    """
+    docs = _build_message_docs(session_id, messages)
+    if not docs:
+        return
+        
+    mongo.db.chat_messages.insert_many(docs, ordered=True)
+    _touch_session(session_id, docs[-1]["timestamp"])
+
+
+def add_messages_bulk(session_id: str, messages):
+    """Append a large batch of messages (history imports, streamed chunks) in one unordered write.
+    
+    Unlike add_messages, the server may apply the inserts in any order and keeps going past
+    individual failures; chronological order is still preserved through the timestamps.
+    
+    Args:
+        session_id (str): The session ID
+        messages (list): Dicts with 'role' and 'content'; any other keys are stored as metadata
+        
+    Returns:
+        int: Number of messages inserted
+    """
+    docs = _build_message_docs(session_id, messages)
+    if not docs:
+        return 0
+        
+    try:
+        result = mongo.db.chat_messages.insert_many(docs, ordered=False)
+    finally:
+        # Unordered inserts may partially apply before raising
+        _touch_session(session_id, docs[-1]["timestamp"])
+    return len(result.inserted_ids)
+
+
+def _build_message_docs(session_id: str, messages):
+    """Turn message dicts into chat_messages documents with consecutive timestamps."""
+    if not messages:
+        return []
+    start = _reserve_timestamps(len(messages))
+    return [
+        {**m, "role": m["role"], "content": m["content"], "session_id": session_id,
+         "timestamp": start + timedelta(milliseconds=i)}
+        for i, m in enumerate(messages)
+    ]
+
+
+def _find_messages(session_id: str, tail=None):
+    """Read a session's messages from chat_messages in chronological order."""
+    cursor = mongo.db.chat_messages.find({"session_id": session_id}, {"_id": 0, "session_id": 0})
+    if tail:
+        # Newest `tail` messages via a reverse index scan, then flip back to chronological order
+        return list(cursor.sort("timestamp", -1).limit(tail))[::-1]
+    return list(cursor.sort("timestamp", 1))
+
+
+def _migrate_embedded_messages(session_id: str, messages):
+    """Move messages stored inline on an older session document into chat_messages.
+    
+    Migrated messages get deterministic ids, so concurrent or repeated migrations of the
+    same session cannot create duplicates."""
+    if messages:
+        docs = [{**m, "_id": f"{session_id}:{i}", "session_id": session_id} for i, m in enumerate(messages)]
+        try:
+            mongo.db.chat_messages.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+    mongo.db.chat_sessions.update_one({"session_id": session_id}, {"$unset": {"messages": ""}})
+
+
+DEFAULT_HISTORY_LIMIT = 100
+MAX_HISTORY_LIMIT = 1000
+
+
+def get_messages(session_id: str, user_id=None, tail=DEFAULT_HISTORY_LIMIT):
+    """Retrieve the most recent messages for a given session, oldest first.
+    
+    If user_id is provided, ensures the session belongs to that user.
+    Only the last `tail` messages are fetched from MongoDB; pass tail=None for the full history."""
     query = {"session_id": session_id}
     if user_id:
         query["user_id"] = user_id
         
-    session = mongo.db.chat_sessions.find_one(query)
-    if not session:
+    # Ownership check; `messages` only exists on sessions created before chat_messages
+    session = mongo.db.chat_sessions.find_one(query, {"_id": 0, "messages": 1})
+    if session is None:  # A matching session without embedded messages projects to {}
         return []
-    return session.get("messages", [])
+    if "messages" in session:
+        _migrate_embedded_messages(session_id, session["messages"])
+    return _find_messages(session_id, tail)
+
+
+DEFAULT_SESSION_PAGE_SIZE = 50
+MAX_SESSION_PAGE_SIZE = 200
 
 
-def list_sessions(user_id):
-    """List all chat sessions for a user with their creation time and title."""
+def list_sessions(user_id, before=None, before_id=None, limit=DEFAULT_SESSION_PAGE_SIZE):
+    """List a page of a user's chat sessions with their creation time and title, newest first.
+    
+    Args:
+        user_id (str): The user whose sessions to list
+        before (datetime, optional): Only return sessions created before this time; pass the
+            last `created_at` of the previous page to get the next one
+        before_id (str, optional): The last `session_id` of the previous page. Breaks ties between
+            sessions created in the same millisecond so none are skipped at a page boundary
+        limit (int): Maximum number of sessions to return
+        
+    Returns:
+        list: Session summaries, newest first
+    """
+    page = (before, before_id, limit)
+    with _cache_lock:
+        cached = _session_list_cache.get(user_id, {}).get(page)
+    if cached is not None:
+        return [dict(s) for s in cached]
+        
+    query = {"user_id": user_id}
+    if before is not None and before_id is not None:
+        query["$or"] = [
+            {"created_at": {"$lt": before}},
+            {"created_at": before, "session_id": {"$lt": before_id}}
+        ]
+    elif before is not None:
+        query["created_at"] = {"$lt": before}
+        
+    # Each page is a bounded range scan of the (user_id, created_at, session_id) index, so no in-memory sort is needed
     sessions = mongo.db.chat_sessions.find(
-        {"user_id": user_id}, 
+        query, 
         {"_id": 0, "session_id": 1, "created_at": 1, "title": 1}
-    )
-    return [
+    ).sort([("created_at", -1), ("session_id", -1)]).limit(limit)
+    result = [
         {
             "session_id": s["session_id"], 
             "created_at": s["created_at"],
@@ -82,6 +312,9 @@ def list_sessions(user_id):
         } 
         for s in sessions
     ]
+    with _cache_lock:
+        _session_list_cache.setdefault(user_id, {})[page] = result
+    return [dict(s) for s in result]
 
 
 def clear_messages(session_id: str, user_id=None):
@@ -92,10 +325,14 @@ def clear_messages(session_id: str, user_id=None):
     if user_id:
         query["user_id"] = user_id
         
-    mongo.db.chat_sessions.update_one(
+    # Also drops any messages still embedded in an older session document
+    result = mongo.db.chat_sessions.update_one(
         query,
-        {"$set": {"messages": []}}
+        {"$unset": {"messages": ""}}
     )
+    if result.matched_count:
+        mongo.db.chat_messages.delete_many({"session_id": session_id})
+        _invalidate_session(session_id)
 
 
 def delete_session(session_id: str, user_id=None):
@@ -106,7 +343,11 @@ def delete_session(session_id: str, user_id=None):
     if user_id:
         query["user_id"] = user_id
         
-    mongo.db.chat_sessions.delete_one(query)
+    # find_one_and_delete hands back the owner, whose cached session list must be dropped
+    deleted = mongo.db.chat_sessions.find_one_and_delete(query, projection={"_id": 0, "user_id": 1})
+    if deleted:
+        mongo.db.chat_messages.delete_many({"session_id": session_id})
+        _invalidate_session(session_id, deleted.get("user_id"))
 
 
 def update_session_title(session_id: str, title: str, user_id=None):
@@ -118,32 +359,61 @@ def update_session_title(session_id: str, title: str, user_id=None):
         user_id (str, optional): If provided, ensures the session belongs to this user
         
     Returns:
-        bool: True if the update was successful, False otherwise
+        bool: True if the session was found, False otherwise
     """
     query = {"session_id": session_id}
     if user_id:
         query["user_id"] = user_id
         
-    result = mongo.db.chat_sessions.update_one(
+    # Ownership check and update in one round-trip; the returned owner scopes cache invalidation
+    doc = mongo.db.chat_sessions.find_one_and_update(
         query,
-        {"$set": {"title": title}}
+        {"$set": {"title": title}},
+        projection={"_id": 0, "user_id": 1}
     )
-    
-    return result.modified_count > 0
+    if doc is None:
+        return False
+        
+    _invalidate_session(session_id, doc.get("user_id"))
+    return True
 
 
-def get_session(session_id: str, user_id=None):
+def get_session(session_id: str, user_id=None, include_messages=True):
     """Get a session by ID.
     
     Args:
         session_id (str): The session ID
         user_id (str, optional): If provided, ensures the session belongs to this user
+        include_messages (bool): Whether to load the message history; metadata-only
+            callers can skip the chat_messages read entirely
         
     Returns:
-        dict: The session document, or None if not found
+        dict: The session document (with its most recent DEFAULT_HISTORY_LIMIT messages if
+            requested), or None if not found
     """
-    query = {"session_id": session_id}
-    if user_id:
-        query["user_id"] = user_id
+    with _cache_lock:
+        metadata = _session_cache.get(session_id)
+        
+    if metadata is None:
+        # `messages` only exists on sessions created before chat_messages; it is migrated out
+        # here, before the metadata is cached
+        session = mongo.db.chat_sessions.find_one(
+            {"session_id": session_id},
+            {"_id": 0, "session_id": 1, "user_id": 1, "title": 1, "created_at": 1, "messages": 1}
+        )
+        if not session:
+            return None
+        if "messages" in session:
+            _migrate_embedded_messages(session_id, session.pop("messages"))
+        metadata = session
+        with _cache_lock:
+            _session_cache[session_id] = metadata
+            
+    if user_id and metadata.get("user_id") != user_id:
+        return None
         
-    return mongo.db.chat_sessions.find_one(query, {"_id": 0})
+    session = dict(metadata)
+    if include_messages:
+        # Read fresh each time and bounded like get_messages; message lists are never cached
+        session["messages"] = _find_messages(session_id, DEFAULT_HISTORY_LIMIT)
+    return session
@@ -1,8 +1,54 @@
 import logging
+import threading
+import weakref
 from typing import Optional
 
+from cachetools import LRUCache
+
 logger = logging.getLogger(__name__)
 
+# Queries at or under this length that aren't phrased as questions already make a good title
+MAX_TITLE_LENGTH = 30
+_QUESTION_WORDS = ("what", "why", "how", "who", "when", "where", "which", "is", "are",
+                   "can", "could", "should", "will", "would", "do", "does", "did", "tell", "explain")
+
+# Built once; the constant instructions come first so providers can reuse the cached prefix
+_PROMPT = """Given the following user query in a news chat application, generate a concise, descriptive title (5 words or less) that captures the main topic. The title should be informative but brief (30 characters max).
+
+Query: '{query}'
+
+Title:"""
+
+# Strips single and double quotes in one pass
+_QUOTE_TABLE = str.maketrans("", "", "\"'")
+
+
+def _looks_like_question(normalized_query: str) -> bool:
+    """Whether a lowercased query reads as a question rather than a topic."""
+    return normalized_query.endswith("?") or normalized_query.split(" ", 1)[0] in _QUESTION_WORDS
+
+
+def _clean_title(content: str) -> str:
+    """Strip whitespace and quotes from an LLM response and cap it at 30 characters."""
+    # Extract and clean the title, removing any quotes
+    title = content.strip().translate(_QUOTE_TABLE)
+    
+    # Limit title length
+    if len(title) > 30:
+        title = title[:27] + "..."
+    return title
+
+
+def _fallback_title(user_query: str) -> str:
+    """Fallback title generation - extract first few words"""
+    if len(user_query) > 30:
+        fallback_title = user_query[:27] + "..."
+    else:
+        fallback_title = user_query
+    
+    logger.info("Using fallback title: '%s'", fallback_title)
+    return fallback_title
+
 class SessionTitleGenerator:
     """Service for generating session titles based on user queries."""
     
@@ -14,6 +60,9 @@ class SessionTitleGenerator:
             llm: The language model instance to use for title generation
         """
         self.llm = llm
+        # Per-instance so the cache lives and dies with this generator's LLM
+        self._cache = LRUCache(maxsize=2048)
+        self._cache_lock = threading.Lock()
     
     def generate_title(self, user_query: str) -> str:
         """
@@ -21,43 +70,42 @@ class SessionTitleGenerator:
         
         Args:
             user_query (str): The user's query to base the title on
-            
+        
         Returns:
             str: A generated title (or a fallback title if generation fails)
         """
+        stripped = " ".join(user_query.split())
+        normalized = stripped.lower()
+        if stripped and len(stripped) <= MAX_TITLE_LENGTH and not _looks_like_question(normalized):
+            return stripped
+        
+        title = self._cache_get(normalized)
+        if title is not None:
+            return title
+        
         try:
-            # Create a prompt for title generation
-            prompt = f"""Given the following user query in a news chat application, generate a concise, descriptive title (5 words or less) that captures the main topic. The title should be informative but brief (30 characters max).
-
-Query: '{user_query}'
-
-Title:"""
-            
-            # Generate the title using the LLM
-            response = self.llm.invoke(prompt)
-            
-            # Extract and clean the title
-            title = response.content.strip()
-            
-            # Limit title length and remove any quotes
-            title = title.replace('"', '').replace("'", "")
-            if len(title) > 30:
-                title = title[:27] + "..."
-                
-            logger.info(f"Generated title: '{title}' for query: '{user_query}'")
+            # The lowercased form is only the cache key; the LLM sees the original casing so names and acronyms survive
+            title = _clean_title(self.llm.invoke(_PROMPT.format(query=stripped)).content)
+            # Failures never reach the cache, so they retry next time
+            self._cache_put(normalized, title)
+            logger.info("Generated title: '%s' for query: '%s'", title, user_query)
             return title
-            
+        
         except Exception as e:
-            logger.error(f"Error generating title: {str(e)}")
-            
-            # Fallback title generation - extract first few words
-            if len(user_query) > 30:
-                fallback_title = user_query[:27] + "..."
-            else:
-                fallback_title = user_query
-                
-            logger.info(f"Using fallback title: '{fallback_title}'")
-            return fallback_title
+            logger.error("Error generating title: %s", e)
+            return _fallback_title(user_query)
+    
+    def _cache_get(self, normalized_query: str) -> Optional[str]:
+        with self._cache_lock:
+            return self._cache.get(normalized_query)
+    
+    def _cache_put(self, normalized_query: str, title: str):
+        with self._cache_lock:
+            self._cache[normalized_query] = title
+
+
+# One generator (and so one title cache) per news agent service; entries go away with the service
+_title_generators = weakref.WeakKeyDictionary()
 
 
 def get_title_generator(news_agent_service) -> Optional[SessionTitleGenerator]:
@@ -66,16 +114,26 @@ def get_title_generator(news_agent_service) -> Optional[SessionTitleGenerator]:
     
     Args:
         news_agent_service: The initialized news agent service with LLM
-        
+    
     Returns:
-        SessionTitleGenerator: The title generator, or None if creation fails
+        SessionTitleGenerator: The shared title generator for this service, or None if creation fails
     """
+    if not news_agent_service:
+        logger.error("News agent service is not properly initialized")
+        return None
+    
     try:
-        if news_agent_service and hasattr(news_agent_service, 'llm'):
-            return SessionTitleGenerator(news_agent_service.llm)
-        else:
+        generator = _title_generators.get(news_agent_service)
+        if generator is not None:
+            return generator
+        
+        llm = getattr(news_agent_service, 'llm', None)
+        if llm is None:
             logger.error("News agent service is not properly initialized")
             return None
+        
+        generator = _title_generators[news_agent_service] = SessionTitleGenerator(llm)
+        return generator
     except Exception as e:
-        logger.error(f"Error creating title generator: {str(e)}")
-        return None 
\ No newline at end of file
+        logger.error("Error creating title generator: %s", e)
+        return None